@@ -0,0 +1,58 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Compiled dpkg control-file parser used by image_scanner when it's built
+
+Build in place with:  cythonize -i _dpkg_parser.pyx
+image_scanner falls back to its pure-Python parser if this isn't compiled.
+"""
+
+from libc.string cimport memchr, memcmp
+
+
+cdef inline dict _make_package(bytes name, bytes version, bytes arch, bytes source):
+    """Build the package dict in the same shape as image_scanner._dpkg_package"""
+    name_str = name.decode('utf-8', errors='replace')
+    return {
+        "name": name_str,
+        "version": version.decode('utf-8', errors='replace'),
+        "architecture": arch.decode('utf-8', errors='replace') if arch is not None else "",
+        "source": source.decode('utf-8', errors='replace') if source is not None else name_str
+    }
+
+
+def parse_dpkg_bytes(bytes content not None):
+    """Parse dpkg control-file style bytes (status file, apt lists) into package dicts"""
+    cdef const char* buf = content
+    cdef Py_ssize_t n = len(content)
+    cdef Py_ssize_t pos = 0
+    cdef Py_ssize_t eol
+    cdef Py_ssize_t length
+    cdef const char* nl
+    cdef char newline = b'\n'
+    cdef list packages = []
+    cdef bytes name = None, version = None, arch = None, source = None
+
+    while pos < n:
+        nl = <const char*>memchr(buf + pos, newline, n - pos)
+        eol = nl - buf if nl != NULL else n
+        length = eol - pos
+
+        if length == 0:
+            # Blank line: end of the current package block
+            if name is not None and version is not None:
+                packages.append(_make_package(name, version, arch, source))
+            name = version = arch = source = None
+        elif length >= 8 and memcmp(buf + pos, b"Package:", 8) == 0:
+            name = content[pos + 8:eol].strip()
+        elif length >= 8 and memcmp(buf + pos, b"Version:", 8) == 0:
+            version = content[pos + 8:eol].strip()
+        elif length >= 7 and memcmp(buf + pos, b"Source:", 7) == 0:
+            source = content[pos + 7:eol].strip()
+        elif length >= 13 and memcmp(buf + pos, b"Architecture:", 13) == 0:
+            arch = content[pos + 13:eol].strip()
+
+        pos = eol + 1
+
+    if name is not None and version is not None:
+        packages.append(_make_package(name, version, arch, source))
+
+    return packages
@@ -1,153 +1,341 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import contextlib
+import io
 import tarfile
 import json
 import os
+import shutil
+import subprocess
 import sys
-import re
+import tempfile
 
+# orjson is optional, it parses and serializes several times faster than the
+# stdlib json module. Both paths write the same 2-space indented UTF-8 files.
+# On stdout the stdlib path keeps escaping non-ASCII text, and orjson's UTF-8
+# bytes go to the binary buffer, so neither depends on the locale's encoding.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def pattern_based_extraction(layer_tar_path):
-    """Extract files matching patterns directly while reading the tarfile"""
+if orjson is not None:
+    json_loads = orjson.loads
     
-    # Define patterns to match (using regular expressions for flexibility)
-    patterns = [
-        r"^var/lib/dpkg/status$",                        # Debian/Ubuntu
-        r"^var/lib/apt/lists/.*_Packages$",              # Debian package lists
-        r"^lib/apk/db/installed$",                       # Alpine
-        r"^var/lib/rpm/.*",                              # RPM-based
-        r"^etc/os-release$",                             # OS detection
-        r"^etc/.*-release$",                             # Various release files
-        r"^etc/issue$"                                   # OS identification
-    ]
+    def print_json(obj):
+        """Print obj to stdout as indented JSON"""
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is None:
+            print(json.dumps(obj, indent=2))
+            return
+        sys.stdout.flush()
+        buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2) + b"\n")
+        buffer.flush()
     
-    # Compile regular expressions
-    compiled_patterns = [re.compile(pattern) for pattern in patterns]
+    def write_json(obj, path):
+        """Write obj to path as indented JSON"""
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+else:
+    json_loads = json.loads
+    
+    def print_json(obj):
+        """Print obj to stdout as indented JSON"""
+        print(json.dumps(obj, indent=2))
+    
+    def write_json(obj, path):
+        """Write obj to path as indented JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, indent=2, ensure_ascii=False)
+
+# Larger tar buffers mean fewer read() calls on multi-MB layer tarballs.
+# bufsize sizes the reads of streamed ('r|') tars, copybufsize the copies
+# done by tarfile itself.
+TAR_BUFSIZE = io.DEFAULT_BUFFER_SIZE * 64   # 512 KiB
+TAR_COPYBUFSIZE = 1 << 20                   # 1 MiB
+
+# Files we want by exact path (checked first, O(1) set lookup). Built once at
+# import time rather than for every layer.
+EXACT_MATCHES = frozenset([
+    "var/lib/dpkg/status",                           # Debian/Ubuntu
+    "lib/apk/db/installed",                          # Alpine
+    "etc/os-release",                                # OS detection
+    "etc/issue"                                      # OS identification
+])
+
+def pattern_based_extraction(layer_tar, rpm_root=None):
+    """Extract files matching patterns directly while reading the tarfile
+
+    layer_tar may be a path to a layer tarball or an already-open TarFile
+    (e.g. one streaming straight out of the image archive). Members are
+    visited in archive order, so streaming ('r|') tars work too.
+
+    If rpm_root is given, RPM database files (often tens of MB) are copied
+    straight from the tar to the same relative path under rpm_root, and their
+    entry in the result is that path instead of the file's bytes.
+
+    dpkg control files (the status file and apt lists) are parsed as they are
+    read, and their entry is the list of package dicts.
+    """
     
     # Store extracted content
     extracted_files = {}
     
-    with tarfile.open(layer_tar_path, 'r') as tar:
+    # Don't close a TarFile the caller handed us
+    if isinstance(layer_tar, tarfile.TarFile):
+        opened = contextlib.nullcontext(layer_tar)
+    else:
+        opened = tarfile.open(layer_tar, 'r', bufsize=TAR_BUFSIZE, copybufsize=TAR_COPYBUFSIZE)
+    
+    with opened as tar:
+        # The loop below runs once per file in the layer, so bind the globals
+        # and methods it uses to locals up front
+        exact_matches = EXACT_MATCHES
+        extractfile = tar.extractfile
+        dirtype = tarfile.DIRTYPE
+        
         for member in tar:
-            # Skip directories
-            if member.isdir():
+            # Skip directories (a plain type compare, what isdir() does without the call)
+            if member.type == dirtype:
                 continue
+            
+            # Check if this file matches any pattern (plain string checks, no regex)
+            name = member.name
+            if not (name in exact_matches
+                    or (name.startswith("var/lib/apt/lists/") and name.endswith("_Packages"))  # Debian package lists
+                    or name.startswith("var/lib/rpm/")                                        # RPM-based
+                    or (name.startswith("etc/") and name.endswith("-release"))):              # Various release files
+                continue
+            
+            try:
+                f = extractfile(member)
+                if not f:
+                    continue
                 
-            # Check if this file matches any pattern
-            for pattern in compiled_patterns:
-                if pattern.match(member.name):
-                    try:
-                        f = tar.extractfile(member)
-                        if f:
-                            extracted_files[member.name] = f.read()
-                    except Exception as e:
-                        print(f"Error extracting {member.name}: {e}")
-                    break
+                # Stream RPM database files to disk rather than holding them in memory
+                if rpm_root is not None and member.isreg() and name.startswith("var/lib/rpm/"):
+                    if ".." in name.split("/"):
+                        print(f"Skipping unsafe path {name}")
+                        continue
+                    dest_path = os.path.join(rpm_root, name)
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    with open(dest_path, "wb") as dest:
+                        shutil.copyfileobj(f, dest, TAR_COPYBUFSIZE)
+                    extracted_files[name] = dest_path
+                # Parse dpkg control files as they stream past, their bytes are never needed again
+                elif name == "var/lib/dpkg/status" or name.startswith("var/lib/apt/lists/"):
+                    extracted_files[name] = parse_dpkg_file(f)
+                else:
+                    extracted_files[name] = f.read()
+            except Exception as e:
+                print(f"Error extracting {name}: {e}")
     
     return extracted_files
 
+def iter_control_blocks(buf):
+    """Yield each blank-line separated block of buf as a memoryview
+
+    Same blocks as buf.split(b"\\n\\n"), but one at a time and without
+    copying, so large package databases don't turn into one big list.
+    """
+    view = memoryview(buf)
+    find = buf.find
+    pos = 0
+    while True:
+        nxt = find(b"\n\n", pos)
+        if nxt < 0:
+            yield view[pos:]
+            break
+        yield view[pos:nxt]
+        pos = nxt + 2
+
+def _dpkg_package(name, version, arch, source):
+    """Build a package dict from the raw control field values"""
+    name_str = name.decode('utf-8', errors='replace')
+    return {
+        "name": name_str,
+        "version": version.decode('utf-8', errors='replace'),
+        "architecture": arch.decode('utf-8', errors='replace') if arch is not None else "",
+        "source": source.decode('utf-8', errors='replace') if source is not None else name_str
+    }
+
+def parse_control_stream(source):
+    """Parse dpkg control-file style data (status file, apt lists) into package dicts
+
+    source is either the file's bytes or a binary file object positioned at
+    its start, e.g. a member streaming out of a layer tar. Either way it is
+    walked once, a line at a time, without ever holding the whole file. Only
+    the Package/Version/Architecture/Source values are sliced out and decoded;
+    a blank line ends the current package.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    
+    name = version = arch = source_name = None
+    for line in source:
+        # Dispatch on the first byte of the line, most lines need nothing more
+        first = line[0]
+        if first == 10:     # blank line: package block is done
+            if name is not None and version is not None:
+                yield _dpkg_package(name, version, arch, source_name)
+            name = version = arch = source_name = None
+        elif first == 80:   # P
+            if line.startswith(b"Package:"):
+                name = line[8:].strip()
+        elif first == 86:   # V
+            if line.startswith(b"Version:"):
+                version = line[8:].strip()
+        elif first == 65:   # A
+            if line.startswith(b"Architecture:"):
+                arch = line[13:].strip()
+        elif first == 83:   # S
+            if line.startswith(b"Source:"):
+                source_name = line[7:].strip()
+    
+    if name is not None and version is not None:
+        yield _dpkg_package(name, version, arch, source_name)
+
+def _parse_dpkg_control(content):
+    """Pure-Python fallback for parse_dpkg_bytes"""
+    return list(parse_control_stream(content))
+
+# Use the compiled parser from _dpkg_parser.pyx when it has been built,
+# otherwise plain Python
+try:
+    import _dpkg_parser
+except ImportError:
+    _dpkg_parser = None
+
+parse_dpkg_bytes = _dpkg_parser.parse_dpkg_bytes if _dpkg_parser is not None else _parse_dpkg_control
+
+def parse_dpkg_file(f):
+    """Parse a dpkg control file from an open binary file object
+
+    The file's lines are streamed through parse_control_stream, so it is
+    never held in memory whole. Only the Cython parser is fast enough to be
+    worth reading the file in one go and handing it the bytes.
+    """
+    if _dpkg_parser is not None:
+        return _dpkg_parser.parse_dpkg_bytes(f.read())
+    return list(parse_control_stream(f))
+
+def _dpkg_file_packages(content):
+    """Packages from a dpkg control file entry, which may already be parsed"""
+    if isinstance(content, list):
+        return content
+    return parse_dpkg_bytes(content)
+
 def extract_dpkg_packages_in_memory(file_contents):
-    """Extract Debian/Ubuntu packages from in-memory status file"""
-    packages = []
+    """Extract Debian/Ubuntu packages from in-memory status file, keyed by package name
+
+    Control files that pattern_based_extraction already parsed while
+    streaming the layer show up as lists of package dicts instead of bytes.
+    """
+    packages = {}
     
     # # Process dpkg status file if available
     if "var/lib/dpkg/status" in file_contents:
-        content = file_contents["var/lib/dpkg/status"].decode('utf-8', errors='replace')
-        pkg_blocks = content.split("\n\n")
-        
-        for block in pkg_blocks:
-            if not block.strip():
-                continue
-                
-            pkg_info = {}
-            lines = block.split("\n")
-            for line in lines:
-                if not line or ":" not in line:
-                    continue
-                key, value = line.split(":", 1)
-                pkg_info[key.strip()] = value.strip()
-            
-            if "Package" in pkg_info and "Version" in pkg_info:
-                packages.append({
-                    "name": pkg_info["Package"],
-                    "version": pkg_info["Version"],
-                    "architecture": pkg_info.get("Architecture", ""),
-                    "source": pkg_info.get("Source", pkg_info["Package"])
-                })
+        packages.update({pkg["name"]: pkg for pkg in _dpkg_file_packages(file_contents["var/lib/dpkg/status"])})
     
     # Process apt lists if available
     apt_lists_files = [k for k in file_contents.keys() if k.startswith("var/lib/apt/lists/") and k.endswith("_Packages")]
     for list_file in apt_lists_files:
-        content = file_contents[list_file].decode('utf-8', errors='replace')
-        pkg_blocks = content.split("\n\n")
-        
-        for block in pkg_blocks:
-            if not block.strip():
-                continue
-                
-            pkg_info = {}
-            lines = block.split("\n")
-            for line in lines:
-                if not line or ":" not in line:
-                    continue
-                key, value = line.split(":", 1)
-                pkg_info[key.strip()] = value.strip()
-            
-            if "Package" in pkg_info and "Version" in pkg_info:
-                packages.append({
-                    "name": pkg_info["Package"],
-                    "version": pkg_info["Version"],
-                    "architecture": pkg_info.get("Architecture", ""),
-                    "source": pkg_info.get("Source", pkg_info["Package"])
-                })
+        packages.update({pkg["name"]: pkg for pkg in _dpkg_file_packages(file_contents[list_file])})
     
     return packages
 
 def extract_apk_packages_in_memory(file_contents):
-    """Extract Alpine Linux packages from in-memory installed db"""
-    packages = []
+    """Extract Alpine Linux packages from in-memory installed db, keyed by package name"""
+    packages = {}
     
     if "lib/apk/db/installed" in file_contents:
-        content = file_contents["lib/apk/db/installed"].decode('utf-8', errors='replace')
-        pkg_blocks = content.split("\n\n")
+        # Work on the raw bytes, only the values we keep get decoded
+        content = file_contents["lib/apk/db/installed"]
         
-        for block in pkg_blocks:
+        for block in iter_control_blocks(content):
+            # Copy out just this block, never the whole file's worth of blocks
+            block = block.tobytes()
             if not block.strip():
                 continue
             
             pkg_info = {}
-            lines = block.split("\n")
+            lines = block.split(b"\n")
             for line in lines:
                 if not line:
                     continue
                 
-                if line.startswith("P:"):
-                    pkg_info["name"] = line[2:].strip()
-                elif line.startswith("V:"):
-                    pkg_info["version"] = line[2:].strip()
-                elif line.startswith("A:"):
-                    pkg_info["architecture"] = line[2:].strip()
-                elif line.startswith("T:"):
-                    pkg_info["description"] = line[2:].strip()
+                if line.startswith(b"P:"):
+                    pkg_info["name"] = line[2:].strip().decode('utf-8', errors='replace')
+                elif line.startswith(b"V:"):
+                    pkg_info["version"] = line[2:].strip().decode('utf-8', errors='replace')
+                elif line.startswith(b"A:"):
+                    pkg_info["architecture"] = line[2:].strip().decode('utf-8', errors='replace')
+                elif line.startswith(b"T:"):
+                    pkg_info["description"] = line[2:].strip().decode('utf-8', errors='replace')
             
             if "name" in pkg_info and "version" in pkg_info:
-                packages.append(pkg_info)
+                packages[pkg_info["name"]] = pkg_info
+    
+    return packages
+
+def _query_rpm_db(rpm_dir):
+    """List the packages in the RPM database at rpm_dir, keyed by package name"""
+    packages = {}
+    
+    # Run rpm command to query the database
+    try:
+        result = subprocess.run(
+            ["rpm", "--dbpath", rpm_dir, "-qa", "--queryformat", "%{NAME}|%{VERSION}|%{ARCH}\n"],
+            capture_output=True,
+            text=True,
+            check=False  # Don't raise exception on non-zero exit
+        )
+        
+        # Process the output
+        for line in result.stdout.splitlines():
+            # Skip warning lines
+            if line.startswith("warning:"):
+                continue
+            
+            # Parse package information
+            if "|" in line:
+                parts = line.strip().split("|")
+                if len(parts) >= 2:
+                    pkg_info = {
+                        "Package": parts[0],
+                        "Version": parts[1],
+                        "Architecture": parts[2] if len(parts) > 2 else ""
+                    }
+                    
+                    packages[pkg_info["Package"]] = {
+                        "name": pkg_info["Package"],
+                        "version": pkg_info["Version"],
+                        "architecture": pkg_info.get("Architecture", ""),
+                        "source": pkg_info.get("Package")
+                    }
+    except Exception as e:
+        print(f"Error running rpm command: {e}")
     
     return packages
 
 def extract_rpm_packages_in_memory(file_contents):
-    """Extract RPM-based packages from in-memory files"""
-    packages = []
+    """Extract RPM-based packages from in-memory files, keyed by package name
+
+    RPM database files that pattern_based_extraction already streamed to disk
+    show up as path strings instead of bytes and are queried where they are.
+    """
+    packages = {}
     
     # Process RPM database if available
     if "var/lib/rpm/Packages" in file_contents:
-        # We need to write the RPM database to a temporary directory
-        import tempfile
-        import shutil
-        import subprocess
-        import os
+        rpm_packages = file_contents["var/lib/rpm/Packages"]
+        
+        # Already on disk, nothing to write
+        if isinstance(rpm_packages, str):
+            return _query_rpm_db(os.path.dirname(rpm_packages))
         
-        # Create temporary directory to hold the RPM database
+        # We need to write the RPM database to a temporary directory
         temp_dir = tempfile.mkdtemp()
         try:
             # Create necessary subdirectories
@@ -156,7 +344,7 @@ def extract_rpm_packages_in_memory(file_contents):
             
             # Write the Packages file
             with open(os.path.join(rpm_dir, "Packages"), "wb") as f:
-                f.write(file_contents["var/lib/rpm/Packages"])
+                f.write(rpm_packages)
             
             # Write other RPM database files if they exist
             for file_path in file_contents:
@@ -166,39 +354,7 @@ def extract_rpm_packages_in_memory(file_contents):
                     with open(dest_path, "wb") as f:
                         f.write(file_contents[file_path])
             
-            # Run rpm command to query the database
-            try:
-                result = subprocess.run(
-                    ["rpm", "--dbpath", rpm_dir, "-qa", "--queryformat", "%{NAME}|%{VERSION}|%{ARCH}\n"],
-                    capture_output=True,
-                    text=True,
-                    check=False  # Don't raise exception on non-zero exit
-                )
-                
-                # Process the output
-                for line in result.stdout.splitlines():
-                    # Skip warning lines
-                    if line.startswith("warning:"):
-                        continue
-                    
-                    # Parse package information
-                    if "|" in line:
-                        parts = line.strip().split("|")
-                        if len(parts) >= 2:
-                            pkg_info = {
-                                "Package": parts[0],
-                                "Version": parts[1],
-                                "Architecture": parts[2] if len(parts) > 2 else ""
-                            }
-                            
-                            packages.append({
-                                "name": pkg_info["Package"],
-                                "version": pkg_info["Version"],
-                                "architecture": pkg_info.get("Architecture", ""),
-                                "source": pkg_info.get("Package")
-                            })
-            except Exception as e:
-                print(f"Error running rpm command: {e}")
+            packages = _query_rpm_db(rpm_dir)
                 
         finally:
             # Clean up temporary directory
@@ -212,12 +368,13 @@ def detect_os_in_memory(file_contents):
     
     # Check os-release first
     if "etc/os-release" in file_contents:
-        content = file_contents["etc/os-release"].decode('utf-8', errors='replace')
+        # Only ID, VERSION_ID and NAME are needed, so decode just those values
+        content = file_contents["etc/os-release"]
         info = {}
         for line in content.splitlines():
-            if '=' in line:
-                key, value = line.split('=', 1)
-                info[key] = value.strip('"\'')
+            key, sep, value = line.partition(b'=')
+            if sep and key in (b"ID", b"VERSION_ID", b"NAME"):
+                info[key.decode('ascii')] = value.strip(b'"\'').decode('utf-8', errors='replace')
         
         os_info = {
             "id": info.get("ID", "unknown"),
@@ -243,67 +400,104 @@ def detect_os_in_memory(file_contents):
     
     return os_info
 
+# Package parser for each package manager detect_os_in_memory can report
+PACKAGE_EXTRACTORS = {
+    "apt": extract_dpkg_packages_in_memory,
+    "apk": extract_apk_packages_in_memory,
+    "rpm": extract_rpm_packages_in_memory, # TODO figure out how the hell to get rpm packages
+}
+
+# Leading bytes of the compressed layer formats tarfile can read
+_COMPRESSED_MAGIC = (b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")
+
+def _layer_open_mode(layer_file):
+    """Pick the tarfile mode for a layer read out of the image archive
+
+    Uncompressed layers are opened for random access ('r:') on top of the
+    seekable outer archive, so the data of every file we don't want (all of
+    an app-code layer, say) is seeked over and never read. Compressed layers
+    can't be seeked through and are streamed ('r|*') instead.
+    """
+    if layer_file.peek(6).startswith(_COMPRESSED_MAGIC):
+        return 'r|*'
+    return 'r:'
+
+def process_layer(image_path, layer_member, layer_num):
+    """Scan a single layer of the image, independently of every other layer
+
+    Returns (layer_num, layer_os_info, packages_by_manager). The layer's files
+    are parsed with every package manager's parser (each one is a no-op when its
+    database isn't in the layer) so that the caller can pick the right one once
+    the image's OS is known, without holding on to the raw file contents.
+
+    layer_member is the layer's TarInfo from the image's member index, so the
+    worker can seek straight to it without re-reading every header.
+    """
+    # Logging
+    print(f"Examining layer number {layer_num}")
+    
+    # RPM databases from this layer are written here and queried in place,
+    # so the directory has to outlive the parsing below
+    with tempfile.TemporaryDirectory() as rpm_root:
+        # Each worker gets its own handle on the image, TarFile isn't thread-safe
+        with tarfile.open(image_path, 'r', bufsize=TAR_BUFSIZE, copybufsize=TAR_COPYBUFSIZE) as tar:
+            # Open the layer straight out of the outer archive, no temp file needed
+            inner = tar.extractfile(layer_member)
+            with tarfile.open(fileobj=inner, mode=_layer_open_mode(inner), bufsize=TAR_BUFSIZE, copybufsize=TAR_COPYBUFSIZE) as layer_tar:
+                # Extract files from this layer if they match a package manager pattern
+                extracted_files = pattern_based_extraction(layer_tar, rpm_root)
+        
+        layer_os_info = detect_os_in_memory(extracted_files)
+        packages_by_manager = {
+            manager: extract(extracted_files) for manager, extract in PACKAGE_EXTRACTORS.items()
+        }
+    
+    return layer_num, layer_os_info, packages_by_manager
+
 def analyze_docker_image_optimized(image_path, out_file = ""):
     """Analyze a Docker image efficiently using in-memory processing"""
     # Track cumulative package state
     all_packages = {}
     os_info = None
     
-    # Create a temporary directory to extract necessary files
-    temp_dir = os.path.join(os.path.dirname(image_path), "temp_extract")
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Extract manifest.json and layer tarballs
-    with tarfile.open(image_path, 'r') as tar:
+    with tarfile.open(image_path, 'r', bufsize=TAR_BUFSIZE, copybufsize=TAR_COPYBUFSIZE) as tar:
+        # Walk the image's headers once and index them by name, getmember()
+        # would rescan the member list on every lookup
+        members = {member.name: member for member in tar.getmembers()}
+        
         # Get the manifest file
-        manifest_member = tar.getmember('manifest.json')
-        manifest_file = tar.extractfile(manifest_member)
-        manifest_data = json.loads(manifest_file.read())
+        manifest_file = tar.extractfile(members['manifest.json'])
+        manifest_data = json_loads(manifest_file.read())
+    
+    layer_members = [members[layer_ref] for layer_ref in manifest_data[0]["Layers"]]
+    
+    # Layers are independent until the merge, so scan them concurrently.
+    # Threads are enough: tar reads and decompression release the GIL.
+    results = []
+    max_workers = max(1, min(len(layer_members), os.cpu_count() or 1))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(process_layer, image_path, layer_member, layer_num)
+            for layer_num, layer_member in enumerate(layer_members)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+    
+    # Merge in layer order so that newer layers override older ones
+    results.sort(key=lambda r: r[0])
+    for layer_num, layer_os_info, packages_by_manager in results:
+        # Detect OS if not already detected
+        if not os_info or os_info["id"] == "unknown":
+            os_info = layer_os_info
         
-        layer_num = 0
-        # Extract each layer tarball
-        for layer_ref in manifest_data[0]["Layers"]:
-            layer_member = tar.getmember(layer_ref)
-            layer_path = os.path.join(temp_dir, os.path.basename(layer_ref))
-            # Logging
-            print(f"Examining layer number {layer_num}") 
-
-            # Extract the layer tarball
-            with open(layer_path, 'wb') as f:
-                f.write(tar.extractfile(layer_member).read())
-            
-            # Extract files from this layer if they match a package manager pattern
-            extracted_files = pattern_based_extraction(layer_path)
-            
-            # Detect OS if not already detected
-            if not os_info or os_info["id"] == "unknown":
-                os_info = detect_os_in_memory(extracted_files)
-            
-            # Extract packages based on OS type
-            # Extract packages based on OS type
-            layer_packages = []
-            if os_info.get("package_manager") == "apt":
-                layer_packages = extract_dpkg_packages_in_memory(extracted_files)
-            elif os_info.get("package_manager") == "apk":
-                layer_packages = extract_apk_packages_in_memory(extracted_files)
-            elif os_info.get("package_manager") == "rpm": # TODO figure out how the hell to get rpm packages
-                layer_packages = extract_rpm_packages_in_memory(extracted_files)
-            
-            # Update package database (newer layers override older ones)
-            for pkg in layer_packages:
-                package_key = pkg["name"]
-                all_packages[package_key] = pkg
-
-            print(f"Detected {len(layer_packages)} packages in layer {layer_num}")
-            layer_num += 1
-            # print(f"\nLayer packages: {layer_packages}\n")
+        # Extract packages based on OS type
+        layer_packages = packages_by_manager.get(os_info.get("package_manager"), {})
+        
+        # Update package database (newer layers override older ones)
+        all_packages.update(layer_packages)
 
-            
-            # Clean up the layer file
-            os.remove(layer_path)
-    
-    # Clean up temp directory
-    os.rmdir(temp_dir)
+        print(f"Detected {len(layer_packages)} packages in layer {layer_num}")
+        # print(f"\nLayer packages: {layer_packages}\n")
     
     # Convert back to list
     packages_list = list(all_packages.values())
@@ -316,11 +510,10 @@ def analyze_docker_image_optimized(image_path, out_file = ""):
     
     
     if out_file != "":
-        with open(out_file, 'w') as f:
-            json.dump(result, f, indent=2)
-            #os.execvp("echo", ["echo", f"Output written to {out_file}"])
+        write_json(result, out_file)
+        #os.execvp("echo", ["echo", f"Output written to {out_file}"])
     else:
-        print(json.dumps(result, indent=2))
+        print_json(result)
     return result
 
 if __name__ == "__main__":
@@ -335,6 +528,6 @@ if __name__ == "__main__":
     result = analyze_docker_image_optimized(sys.argv[1]) if len(sys.argv)<3 else analyze_docker_image_optimized(sys.argv[1], sys.argv[2])
     
     
-    # Output is already handled in the function with json.dumps
+    # Output is already handled in the function with print_json
 
     # result = analyze_docker_image_optimized("centos_postgres.tar") # hardcoded for testing
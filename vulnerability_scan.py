@@ -1,6 +1,10 @@
 from image_scanner import *
+import concurrent.futures
+import threading
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import sys
 from dotenv import load_dotenv 
@@ -17,6 +21,47 @@ if api_key is None:
 
 url = "https://services.nvd.nist.gov/rest/json/cves/2.0"
 
+# Number of package batches queried at once
+NVD_WORKERS = 4
+
+# NVD allows 50 requests per rolling 30 seconds with an API key. Request starts
+# are spaced at least this far apart, whatever NVD_WORKERS is set to.
+NVD_REQUEST_INTERVAL = 30 / 50
+_rate_lock = threading.Lock()
+_next_request_at = 0.0
+
+
+def _wait_for_rate_limit():
+    """Block until this thread may send the next NVD request"""
+    global _next_request_at
+    with _rate_lock:
+        now = time.monotonic()
+        start = max(now, _next_request_at)
+        _next_request_at = start + NVD_REQUEST_INTERVAL
+    if start > now:
+        time.sleep(start - now)
+
+# NVD answers 403 when it throttles, so that is retried along with 429/5xx.
+# One keep-alive session for every NVD request so we don't pay a TCP/TLS handshake per query
+session = requests.Session()
+session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=(403, 429, 500, 502, 503, 504), raise_on_status=False)
+))
+
+
+def query_nvd(params, headers):
+    """GET the NVD CVE API, returning the decoded JSON or None if the query failed"""
+    _wait_for_rate_limit()
+    try:
+        response = session.get(url, params=params, headers=headers)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"NVD query failed: {e}")
+        return None
+    return json_loads(response.content)
+
 
 def search_os(start_index=0, results_per_page=20,headers=None,params=None, data=None):
     if data is None:
@@ -24,10 +69,9 @@ def search_os(start_index=0, results_per_page=20,headers=None,params=None, data=
     #print(d['id'])
     #print(d['version_id'])
     params["keywordSearch"] = data['id'] + " " + data['version_id']
-    response = requests.get(url, params=params, headers=headers)
-    data = response.json()
+    data = query_nvd(params, headers)
     vulns = []
-    if data["totalResults"] > 0:
+    if data is not None and data["totalResults"] > 0:
             #print(f"Vulnerabilities found for {pkg_info['Package']}:")
         for vuln in data.get('vulnerabilities', []):
             #print(f"  - {vuln.get('cve', {}).get('id')}")
@@ -60,30 +104,38 @@ def search_packages(start_index=0, results_per_page=50, headers=None,params=None
     #now batch request all these packages
     
     
-    for i in range(len(batched_packages)):
+    def search_batch(batch):
 #        params["keywordSearch"] = " OR ".join(p_t[i])
-        params["keywordSearch"] = batched_packages[i]
-#        print(params["keywordSearch"])
+        # Each batch gets its own copy of params since batches run concurrently
+        batch_params = dict(params, keywordSearch=batch)
+#        print(batch_params["keywordSearch"])
         
         
-        response = requests.get(url, params=params, headers=headers)
-        #print(response)
-        if response.status_code != 200:
-            continue
-        data = response.json()
+        data = query_nvd(batch_params, headers)
+        if data is None:
+            print(f"Skipping batch of {len(batch)} packages, NVD query failed")
+            return None
         #print(data)
         vulns = []
-        vulns_by_package = {pkg: [] for pkg in batched_packages[i]}
+        vulns_by_package = {pkg: [] for pkg in batch}
         for vuln in data.get('vulnerabilities', []):
-            for pkg in batched_packages[i]:
-                if pkg in vuln.get('cve', {}).get('descriptions', [{}])[0].get('value', ''):
-                    vulns_by_package[pkg].append(
-                    vuln.get('cve', {}).get('id') + " " +
-                    vuln.get('cve', {}).get('descriptions', [{}])[0].get('value')[:100]
-                    )
+            # Look the description up once per CVE rather than once per package in the batch
+            cve = vuln.get('cve', {})
+            description = cve.get('descriptions', [{}])[0].get('value', '')
+            summary = None
+            for pkg in batch:
+                if pkg in description:
+                    if summary is None:
+                        summary = cve.get('id') + " " + description[:100]
+                    vulns_by_package[pkg].append(summary)
         vulns.append(vulns_by_package)
+        return vulns
     
-        batched_vulnerabilities.append(vulns)
+    # map() keeps results in batch order, failed batches are dropped (and reported above)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=NVD_WORKERS) as executor:
+        for vulns in executor.map(search_batch, batched_packages):
+            if vulns is not None:
+                batched_vulnerabilities.append(vulns)
     return batched_vulnerabilities
 
 
@@ -93,11 +145,12 @@ def search_cve( start_index=0, results_per_page=20, txt_file=None,text_file2=Non
     params = {
         "startIndex": start_index,
         "resultsPerPage": results_per_page,
-        "cvssV2Severity": f[0] if len(flags)>0 else None,
+        "cvssV2Severity": flags[0] if len(flags)>0 else None,
     }
     headers = {}
     headers["apiKey"]=api_key
-    image_data = json.load(open(txt_file))
+    with open(txt_file, 'rb') as fh:
+        image_data = json_loads(fh.read())
     
     os_vulnerabilities = search_os(start_index,results_per_page,headers,params,data=image_data['os'])
     package_vulnerabilities = search_packages(start_index,results_per_page,headers,params,data=image_data['packages'])
@@ -126,7 +179,7 @@ def search_cve( start_index=0, results_per_page=20, txt_file=None,text_file2=Non
         "package_count": sum(len(x) for x in compiled_package_vulnerabilities),
         "Vulnerability_count": count
     }
-    json.dump(result, open(text_file2, "w"), indent=4)
+    write_json(result, text_file2)
 
 if __name__ == "__main__":
     flag = False